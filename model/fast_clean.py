@@ -0,0 +1,112 @@
+import numpy as np
+from numba import njit
+
+# Header words removed by clean_text, as a padded byte table for the jitted kernel
+_HDR_WORDS = [w.encode("ascii") for w in ("re", "fwd", "fw", "forwarded", "cc", "to", "from", "subject")]
+_HDR_LEN = np.array([len(w) for w in _HDR_WORDS], dtype=np.int64)
+_HDR_BUF = np.zeros((len(_HDR_WORDS), int(_HDR_LEN.max())), dtype=np.uint8)
+for _k, _w in enumerate(_HDR_WORDS):
+    _HDR_BUF[_k, :len(_w)] = np.frombuffer(_w, dtype=np.uint8)
+
+
+@njit(cache=True)
+def _is_space(c):
+    # ASCII characters matched by Python's \s
+    return c == 32 or 9 <= c <= 13 or 28 <= c <= 31
+
+
+@njit(cache=True)
+def _is_word(c):
+    # ASCII characters matched by \w (after lowercasing)
+    return 97 <= c <= 122 or 48 <= c <= 57 or c == 95
+
+
+@njit(cache=True)
+def _is_header(b, s, e):
+    n = e - s
+    for k in range(_HDR_BUF.shape[0]):
+        if _HDR_LEN[k] != n:
+            continue
+        match = True
+        for m in range(n):
+            if b[s + m] != _HDR_BUF[k, m]:
+                match = False
+                break
+        if match:
+            return True
+    return False
+
+
+@njit(cache=True)
+def _clean_bytes(b):
+    n = len(b)
+    low = np.empty(n, dtype=np.uint8)
+    for i in range(n):
+        c = b[i]
+        low[i] = c + 32 if 65 <= c <= 90 else c
+
+    out = np.empty(n, dtype=np.uint8)
+    j = 0
+    i = 0
+    while i < n:
+        if _is_space(low[i]):
+            i += 1
+            continue
+        # one whitespace-delimited token [s, e)
+        s = i
+        while i < n and not _is_space(low[i]):
+            i += 1
+        e = i
+
+        # \S+@\S+ removes the whole token
+        drop = False
+        for k in range(s + 1, e - 1):
+            if low[k] == 64:
+                drop = True
+                break
+        if drop:
+            continue
+
+        # http\S+ / www\S+ remove everything from the first occurrence
+        for p in range(s, e):
+            if p + 4 < e and low[p] == 104 and low[p + 1] == 116 and low[p + 2] == 116 and low[p + 3] == 112:
+                e = p
+                break
+            if p + 3 < e and low[p] == 119 and low[p + 1] == 119 and low[p + 2] == 119:
+                e = p
+                break
+
+        # header words must be a whole \w run; of everything else only letter runs survive
+        p = s
+        while p < e:
+            if not _is_word(low[p]):
+                p += 1
+                continue
+            ws = p
+            while p < e and _is_word(low[p]):
+                p += 1
+            if _is_header(low, ws, p):
+                continue
+            q = ws
+            while q < p:
+                if not 97 <= low[q] <= 122:
+                    q += 1
+                    continue
+                if j > 0:
+                    out[j] = 32
+                    j += 1
+                while q < p and 97 <= low[q] <= 122:
+                    out[j] = low[q]
+                    j += 1
+                    q += 1
+    return out[:j]
+
+
+def clean_ascii(text: str) -> str:
+    """Single-pass equivalent of inference_server.clean_text for ASCII-only text."""
+    buf = np.frombuffer(text.encode("ascii"), dtype=np.uint8)
+    return _clean_bytes(buf).tobytes().decode("ascii")
+
+
+# Compile (or load from cache) at import rather than on the first request
+clean_ascii("")
@@ -2,14 +2,34 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import tensorflow as tf
-from keras.preprocessing.sequence import pad_sequences
 import numpy as np
 import pickle
 import json
+import hashlib
+import os
+import asyncio
 import re
 from pathlib import Path
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 
-app = FastAPI()
+import sefaced_layers  # registers FrozenEmbedding for load_model
+
+try:
+    from fast_clean import clean_ascii
+except ImportError:  # numba not installed: regex clean_text only
+    clean_ascii = None
+
+@asynccontextmanager
+async def lifespan(app):
+    # Start the micro-batching worker on the server's event loop
+    global _queue, _worker
+    _queue = asyncio.Queue()
+    _worker = asyncio.create_task(_batch_worker())
+    yield
+    _worker.cancel()
+
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -23,34 +43,159 @@ with open(BASE / "tokenizer.pickle", "rb") as f:
     tokenizer = pickle.load(f)
 with open(BASE / "meta.json", "r") as f:
     meta = json.load(f)
-model = tf.keras.models.load_model(str(BASE / "sefaced_email_model.keras"))
+maxlen = meta.get("maxlen", 600)
+vocab_size = meta.get("vocab_size", 70000)
+
+# Tokenize in TF instead of Tokenizer.texts_to_sequences. TextVectorization reserves
+# 0 for padding and 1 for OOV, matching the tokenizer's "<OOV>" id, so the remaining
+# words keep their word_index ids.
+vectorizer = tf.keras.layers.TextVectorization(
+    max_tokens=vocab_size, standardize=None, split="whitespace", output_mode="int"
+)
+vectorizer.set_vocabulary(
+    [w for w, i in sorted(tokenizer.word_index.items(), key=lambda kv: kv[1]) if 1 < i < vocab_size]
+)
+
+@tf.function(input_signature=[tf.TensorSpec([1], tf.string)])
+def vectorize(texts):
+    # Same as pad_sequences(padding="post"): keep the last maxlen tokens, pad at the end
+    seq = tf.cast(vectorizer(texts), tf.int32)[:, -maxlen:]
+    seq = tf.pad(seq, [[0, 0], [0, maxlen - tf.shape(seq)[1]]])
+    # As in training, an empty text becomes a single OOV token so its mask isn't empty
+    empty = tf.reduce_all(tf.equal(seq, 0), axis=1, keepdims=True)
+    return tf.where(empty & tf.equal(tf.range(maxlen), 0), 1, seq)
+
+# Micro-batching: requests arriving within MAX_WAIT of each other share one forward pass
+MAX_BATCH = 32
+MAX_WAIT = 0.005
+
+# Serve the quantized TFLite export when present; SPOOFGUARD_USE_KERAS=1 forces the
+# full Keras model (e.g. for debugging accuracy differences).
+TFLITE_PATH = BASE / "sefaced_email_model.tflite"
+USE_KERAS = os.environ.get("SPOOFGUARD_USE_KERAS") == "1" or not TFLITE_PATH.exists()
+
+if USE_KERAS:
+    model = tf.keras.models.load_model(str(BASE / "sefaced_email_model.keras"))
+    infer = tf.function(lambda x: model(x, training=False), jit_compile=True).get_concrete_function(
+        tf.TensorSpec([None, maxlen], tf.int32)
+    )
+
+    # XLA compiles once per input shape, so batches are padded up to a power of two
+    # and every size is compiled at startup instead of on live requests
+    BATCH_SIZES = sorted({min(2 ** k, MAX_BATCH) for k in range(MAX_BATCH.bit_length() + 1)})
+
+    def predict_batch(x: np.ndarray) -> np.ndarray:
+        n = len(x)
+        size = next(s for s in BATCH_SIZES if s >= n)
+        # Repeat the last row as filler; rows don't interact, so it is sliced off unchanged
+        x = np.pad(x, ((0, size - n), (0, 0)), mode="edge")
+        return infer(tf.constant(x, dtype=tf.int32)).numpy()[:n]
+else:
+    interp = tf.lite.Interpreter(model_path=str(TFLITE_PATH))
+    interp.allocate_tensors()
+    _input = interp.get_input_details()[0]
+    _output = interp.get_output_details()[0]
+
+    def predict_batch(x: np.ndarray) -> np.ndarray:
+        # The export takes a single (1, maxlen) row, which keeps it to builtin ops
+        probs = []
+        for row in x.astype(_input["dtype"], copy=False):
+            interp.set_tensor(_input["index"], row[None])
+            interp.invoke()
+            probs.append(interp.get_tensor(_output["index"])[0])
+        return np.stack(probs)
+
+# Warm up so graph compilation happens at startup rather than on the first request
+for _size in (BATCH_SIZES if USE_KERAS else [1]):
+    predict_batch(np.zeros((_size, maxlen), dtype=np.int32))
+
+_URL = re.compile(r"http\S+|www\S+|\S+@\S+")
+_HDR = re.compile(r"\b(re|fwd|fw|forwarded|cc|to|from|subject)\b")
+_NONALPHA = re.compile(r"[^a-z\s]+")
+_WS = re.compile(r"\s+")
 
 class ClassifyRequest(BaseModel):
     text: str
 
+# Declared as the return type so FastAPI serializes the response through pydantic's
+# Rust core instead of jsonable_encoder
+class ClassifyResponse(BaseModel):
+    label: str
+    probabilities: dict[str, float]
+
 def clean_text(text: str) -> str:
     t = text.lower()
-    t = re.sub(r"http\S+", " ", t)
-    t = re.sub(r"www\S+", " ", t)
-    t = re.sub(r"\S+@\S+", " ", t)
-    t = re.sub(r"\b(re|fwd|fw|forwarded|cc|to|from|subject)\b", " ", t)
-    t = re.sub(r"\d+", " ", t)
-    t = re.sub(r"\s+", " ", t)
-    t = re.sub(r"[^a-z\s]", " ", t)
-    return t.strip()
+    t = _URL.sub(" ", t)
+    t = _HDR.sub(" ", t)
+    t = _NONALPHA.sub(" ", t)
+    return _WS.sub(" ", t).strip()
 
 def preprocess(text: str):
-    cleaned = clean_text(text or "")
-    seq = tokenizer.texts_to_sequences([cleaned])
-    return pad_sequences(seq, maxlen=meta.get("maxlen", 600), padding="post")
+    text = text or ""
+    # The jitted single-pass cleaner matches clean_text exactly for ASCII input
+    cleaned = clean_ascii(text) if clean_ascii is not None and text.isascii() else clean_text(text)
+    return vectorize(tf.constant([cleaned])).numpy()
+
+# Retried / duplicated emails skip cleaning and tokenization. The LRU is keyed on a
+# digest so it never holds full email bodies, and ids are cached as immutable bytes
+# so callers can't mutate a shared array.
+PREPROCESS_CACHE_SIZE = 2048
+_preprocess_cache = OrderedDict()
+
+def preprocess_cached(text: str):
+    key = hashlib.blake2b((text or "").encode("utf-8", "surrogatepass")).digest()
+    ids = _preprocess_cache.get(key)
+    if ids is None:
+        ids = preprocess(text).tobytes()
+        _preprocess_cache[key] = ids
+        if len(_preprocess_cache) > PREPROCESS_CACHE_SIZE:
+            _preprocess_cache.popitem(last=False)
+    else:
+        _preprocess_cache.move_to_end(key)
+    return np.frombuffer(ids, dtype=np.int32).reshape(1, maxlen)
+
+_queue = None
+_worker = None
+
+async def _batch_worker():
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await _queue.get()]
+        # Any failure is delivered to this batch's callers; the worker itself keeps running
+        try:
+            deadline = loop.time() + MAX_WAIT
+            while len(batch) < MAX_BATCH:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(_queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            xs = np.concatenate([x for x, _ in batch])
+            probs = await loop.run_in_executor(None, predict_batch, xs)
+            for (_, fut), p in zip(batch, probs):
+                if not fut.done():
+                    fut.set_result(p)
+        except Exception as e:
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+
+async def submit(x):
+    if _worker is None or _worker.done():
+        raise RuntimeError("batch worker is not running")
+    fut = asyncio.get_running_loop().create_future()
+    await _queue.put((x, fut))
+    return await fut
 
 @app.post("/classify")
-async def classify(req: ClassifyRequest):
-    x = preprocess(req.text)
-    probs = model.predict(x, verbose=0)[0]
+async def classify(req: ClassifyRequest) -> ClassifyResponse:
+    x = preprocess_cached(req.text)
+    probs = await submit(x)
     labels = meta.get("label_classes", ["Normal", "Fraudulent", "Harassing", "Suspicious"])
     idx = int(np.argmax(probs))
-    return {
-        "label": labels[idx],
-        "probabilities": {labels[i]: float(probs[i]) for i in range(len(labels))}
-    }
\ No newline at end of file
+    return ClassifyResponse(
+        label=labels[idx],
+        probabilities={labels[i]: float(probs[i]) for i in range(len(labels))}
+    )
\ No newline at end of file
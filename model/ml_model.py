@@ -1,42 +1,51 @@
 #implementation of SeFACED
 import pandas as pd
-import spacy
 import string
 import re
+import itertools
 import json
 import tensorflow as tf
-import gensim
-from gensim.models import Word2Vec
 import numpy as np
-from nltk.corpus import stopwords
+from pathlib import Path
 from tensorflow.keras.preprocessing.text import Tokenizer
 from tensorflow.keras.callbacks import EarlyStopping, ModelCheckpoint
 from keras.preprocessing.sequence import pad_sequences
 from keras.models import Sequential
-from keras.utils import to_categorical
-from keras.layers import Dense, Embedding,LSTM, Dropout, GRU, Bidirectional
+from keras.layers import Input, Dense, LSTM, Dropout, GRU, Bidirectional
+from sefaced_layers import FrozenEmbedding
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import normalize
 from sklearn.naive_bayes import MultinomialNB
 from sklearn.linear_model import LogisticRegression
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.preprocessing import LabelEncoder
 from sklearn.svm import SVC
 from sklearn.metrics import accuracy_score
-from sklearn.feature_extraction.text import TfidfVectorizer, CountVectorizer
+from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.utils.class_weight import compute_class_weight
 
-# !pip install gensim
-# !pip install --upgrade gensim
+# !pip install pyarrow
 # !wget http://nlp.stanford.edu/data/glove.6B.zip
 # !unzip glove.6B.zip
 
+#Mixed precision: float16 compute with float32 variables
+tf.keras.mixed_precision.set_global_policy('mixed_float16')
+
 #for runtime
 import time
 start = time.time()
 
-#input data from excel file
-df = pd.read_excel("/content/SEFACED_Email_Forensic_Dataset.xlsx")
+#input data from excel file, cached as parquet next to it (rebuilt when the xlsx is newer)
+dataset_path = Path("/content/SEFACED_Email_Forensic_Dataset.xlsx")
+dataset_cache = dataset_path.with_suffix('.parquet')
+if dataset_cache.exists() and dataset_cache.stat().st_mtime >= dataset_path.stat().st_mtime:
+    df = pd.read_parquet(dataset_cache)
+else:
+    df = pd.read_excel(
+        dataset_path,
+        usecols=['Text', 'Class_Label'],
+        dtype={'Text': 'string', 'Class_Label': 'category'}
+    )
+    df.to_parquet(dataset_cache)
 
 #For testing purposes
 print(df.head())
@@ -45,13 +54,30 @@ print(df.head())
 
 ###Data Pre-processing###
 
-#nltk.download('stopwords')
-import nltk
-nltk.download('stopwords')
-nltk.download('punkt')
-nltk.download('wordnet')
-
-stop_words = set(stopwords.words('english'))
+#Standard English stopword list (NLTK 'english' corpus), inlined to avoid the download
+STOPWORDS = frozenset({
+    'i', 'me', 'my', 'myself', 'we', 'our', 'ours', 'ourselves', 'you',
+    "you're", "you've", "you'll", "you'd", 'your', 'yours', 'yourself',
+    'yourselves', 'he', 'him', 'his', 'himself', 'she', "she's", 'her', 'hers',
+    'herself', 'it', "it's", 'its', 'itself', 'they', 'them', 'their',
+    'theirs', 'themselves', 'what', 'which', 'who', 'whom', 'this', 'that',
+    "that'll", 'these', 'those', 'am', 'is', 'are', 'was', 'were', 'be',
+    'been', 'being', 'have', 'has', 'had', 'having', 'do', 'does', 'did',
+    'doing', 'a', 'an', 'the', 'and', 'but', 'if', 'or', 'because', 'as',
+    'until', 'while', 'of', 'at', 'by', 'for', 'with', 'about', 'against',
+    'between', 'into', 'through', 'during', 'before', 'after', 'above',
+    'below', 'to', 'from', 'up', 'down', 'in', 'out', 'on', 'off', 'over',
+    'under', 'again', 'further', 'then', 'once', 'here', 'there', 'when',
+    'where', 'why', 'how', 'all', 'any', 'both', 'each', 'few', 'more', 'most',
+    'other', 'some', 'such', 'no', 'nor', 'not', 'only', 'own', 'same', 'so',
+    'than', 'too', 'very', 's', 't', 'can', 'will', 'just', 'don', "don't",
+    'should', "should've", 'now', 'd', 'll', 'm', 'o', 're', 've', 'y', 'ain',
+    'aren', "aren't", 'couldn', "couldn't", 'didn', "didn't", 'doesn',
+    "doesn't", 'hadn', "hadn't", 'hasn', "hasn't", 'haven', "haven't", 'isn',
+    "isn't", 'ma', 'mightn', "mightn't", 'mustn', "mustn't", 'needn',
+    "needn't", 'shan', "shan't", 'shouldn', "shouldn't", 'wasn', "wasn't",
+    'weren', "weren't", 'won', "won't", 'wouldn', "wouldn't"
+})
 punctuation = set(string.punctuation)
 
 #Create copy for cleaned data
@@ -59,55 +85,53 @@ df_cleaned = df.copy()
 
 #only cleaning "text" column
 text_column = 'Text'
-#Tokenization using SpaCy library
-nlp = spacy.load('en_core_web_sm')
-stop_words = set(stopwords.words('english'))
 cleaned = []
 text_data = df_cleaned[text_column].astype(str).tolist()
 
-def clean_text(text):
-    if pd.isna(text):
-        return ""
-    #Lowercase and remove empty tokens
-    text = str(text).lower()
-    #Remove email tags
-    text = re.sub(r'http\S+', ' ', text)
-    text = re.sub(r'www\S+', ' ', text)
-    text = re.sub(r'\S+@\S+', ' ', text)
-    #Remove Forward and Hyperlinks
-    text = re.sub(r'\b(Re|Fwd|FW|forwarded|cc|To|From|Subject)\b', ' ', text, flags=re.IGNORECASE)
-    #Remove numbers
-    text = re.sub(r'\d+', ' ', text)
-    #Remove whitespace and tab
-    text = re.sub(r'\s+', ' ', text)
-    #Remove symbols
-    text = re.sub(r'[^a-z\s]', ' ', text)
-    #Remove stopwords
-    tokens = [t for t in text.split() if t not in stop_words and len(t) > 2]
-    return " ".join(tokens)
-
-df_cleaned['cleaned_text'] = df_cleaned['Text'].apply(clean_text)
+#Precompiled cleaning patterns
+_URL = re.compile(r'http\S+|www\S+|\S+@\S+')
+_HDR = re.compile(r'\b(re|fwd|fw|forwarded|cc|to|from|subject)\b', re.IGNORECASE)
+_NONALPHA = re.compile(r'[^a-z\s]+')
+_WS = re.compile(r'\s+')
+
+#Stopwords and tokens shorter than 3 letters, matched as whole words
+_STOP = re.compile(r'\b(?:' + '|'.join(map(re.escape, sorted(STOPWORDS))) + r'|[a-z]{1,2})\b')
+
+#Vectorized cleaning over the whole column (NA propagates through StringDtype)
+s = df_cleaned['Text'].astype('string').str.lower()
+#Remove links and email addresses
+s = s.str.replace(_URL, ' ', regex=True)
+#Remove Forward and Reply headers
+s = s.str.replace(_HDR, ' ', regex=True)
+#Remove numbers and symbols
+s = s.str.replace(_NONALPHA, ' ', regex=True)
+#Remove stopwords
+s = s.str.replace(_STOP, ' ', regex=True)
+#Remove whitespace and tab
+s = s.str.replace(_WS, ' ', regex=True).str.strip()
+df_cleaned['cleaned_text'] = s.fillna('')
 print(df_cleaned[['Text', 'cleaned_text']].head())
 
 ###SPLIT 65% TRAINING TESTING 25% VALIDATION 10%###
 text_column = 'cleaned_text'
 target_column = 'Class_Label'
-class_labels = df_cleaned['Class_Label'].values
+#Encode labels as category codes (categories are sorted, same ids as LabelEncoder)
+cats = df_cleaned[target_column].astype('category')
+y = cats.cat.codes.to_numpy().astype(np.int32)
+class_names = list(cats.cat.categories)
 
 #split
-y = df_cleaned[target_column].values
-X_temp, X_test, y_temp, y_test = train_test_split(
-    df_cleaned['cleaned_text'], y, test_size=0.25, random_state=42, stratify=class_labels
+X_temp, X_test, y_temp, y_test_le = train_test_split(
+    df_cleaned['cleaned_text'], y, test_size=0.25, random_state=42, stratify=y
 )
 fraction = 0.10 / 0.75  # Adjusted fraction for validation set
-X_train, X_val, y_train, y_val = train_test_split(
+X_train, X_val, y_train_le, y_val_le = train_test_split(
     X_temp, y_temp, test_size=fraction, random_state=42,stratify=y_temp
 )
 
 
 
 ###Feature Extraction###
-X_text = df_cleaned['cleaned_text']
 #TF-IDF
 tfidf = TfidfVectorizer()
 X_train_tfidf = tfidf.fit_transform(X_train)
@@ -115,26 +139,6 @@ X_val_tfidf = tfidf.transform(X_val)
 X_test_tfidf = tfidf.transform(X_test)
 
 
-#Bag of Words
-vector = CountVectorizer()
-bag_of_words = vector.fit_transform(X_text)
-words = vector.get_feature_names_out()
-word_counts = bag_of_words.toarray().sum(axis=0)
-
-#Word2vector
-tokenized_text = [text.split() for text in X_text]
-word2vec_cbow_model = gensim.models.Word2Vec(sentences=tokenized_text, min_count=1, vector_size=100, window=5)
-word2vec_sg_model = gensim.models.Word2Vec(sentences=tokenized_text, min_count=1, window=5, sg=1)
-
-
-
-label_encoder = LabelEncoder()
-y_train_le = label_encoder.fit_transform(y_train)
-y_val_le = label_encoder.transform(y_val)
-y_test_le = label_encoder.transform(y_test)
-
-
-
 
 ###Machine Learning Models to compare###
 
@@ -191,70 +195,104 @@ X_train_seq = tokenizer.texts_to_sequences(X_train)
 X_val_seq = tokenizer.texts_to_sequences(X_val)
 X_test_seq = tokenizer.texts_to_sequences(X_test)
 
-X_train_pad = pad_sequences(X_train_seq, maxlen=max_length, padding="post")
-X_val_pad = pad_sequences(X_val_seq, maxlen=max_length, padding="post")
-X_test_pad = pad_sequences(X_test_seq, maxlen=max_length, padding="post")
+#Shrink max_length to the 95th percentile of training lengths (capped at the paper's 600)
+lengths = np.array([len(s) for s in X_train_seq])
+max_length = min(max_length, max(1, int(np.percentile(lengths, 95))))
 
-num_classes = len(label_encoder.classes_)
-y_train_cat = tf.keras.utils.to_categorical(y_train_le, num_classes)
-y_val_cat = tf.keras.utils.to_categorical(y_val_le, num_classes)
-y_test_cat = tf.keras.utils.to_categorical(y_test_le, num_classes)
+#Padding is masked (see FrozenEmbedding below), so the amount of post-padding doesn't
+#change predictions; empty texts become a single OOV token so no mask row is empty
+oov_id = tokenizer.word_index['<OOV>']
+X_train_seq = [s or [oov_id] for s in X_train_seq]
+X_val_seq = [s or [oov_id] for s in X_val_seq]
+X_test_seq = [s or [oov_id] for s in X_test_seq]
 
-#for embedding matrix
+X_val_pad = pad_sequences(X_val_seq, maxlen=max_length, padding="post").astype(np.int32, copy=False)
+X_test_pad = pad_sequences(X_test_seq, maxlen=max_length, padding="post").astype(np.int32, copy=False)
 
-embedding_index = {}
+#for embedding matrix
+#stream GloVe and copy only the vectors for words in the tokenizer vocabulary
+wanted = {w: i for w, i in tokenizer.word_index.items() if i < vocab_size}
+embedding_matrix = np.zeros((vocab_size, embedding_dim), dtype=np.float32)
 
 with open('glove.6B.300d.txt', encoding='utf8') as f:
   for line in f:
-    values = line.split()
-    word = values[0]
-    coeffs = np.asarray(values[1:], dtype='float32')
-    embedding_index[word] = coeffs
-
-embedding_matrix = np.zeros((vocab_size, embedding_dim))
-
-for word, i in tokenizer.word_index.items():
-  if i < vocab_size:
-    vector = embedding_index.get(word)
-    if vector is not None:
-      embedding_matrix[i] = vector
-      
+    word, _, rest = line.partition(' ')
+    i = wanted.get(word)
+    if i is not None:
+      embedding_matrix[i] = np.fromstring(rest, sep=' ', dtype=np.float32)
+embedding_matrix = np.ascontiguousarray(embedding_matrix, dtype=np.float32)
+
+
+#Bucketed training batches: each batch is post-padded only up to its bucket boundary
+#(truncating like pad_sequences keeps the last max_length tokens). Validation, test and
+#the server pad to max_length instead, which is equivalent because padding is masked.
+X_train_trunc = [s[-max_length:] for s in X_train_seq]
+X_train_rt = tf.RaggedTensor.from_row_lengths(
+    np.fromiter(itertools.chain.from_iterable(X_train_trunc), dtype=np.int32),
+    np.fromiter((len(s) for s in X_train_trunc), dtype=np.int64, count=len(X_train_trunc))
+)
+bucket_boundaries = [b for b in (64, 128, 256, 512) if b < max_length] + [max_length + 1]
+#Slices of a RaggedTensor come out as ragged elements, which padded_batch rejects,
+#so tf.identity turns each row into a dense tensor first
+ds_train = tf.data.Dataset.from_tensor_slices((X_train_rt, y_train_le)).map(lambda x, y: (tf.identity(x), y))
+#cache after densifying so it holds dense rows, then shuffle/bucket per epoch and
+#prefetch so host-side batching overlaps with the training step
+ds_train = ds_train.cache().shuffle(len(X_train_trunc)).bucket_by_sequence_length(
+    element_length_func=lambda x, y: tf.shape(x)[0],
+    bucket_boundaries=bucket_boundaries,
+    bucket_batch_sizes=[64] * (len(bucket_boundaries) + 1),
+    pad_to_bucket_boundary=True
+).prefetch(tf.data.AUTOTUNE)
+ds_val = tf.data.Dataset.from_tensor_slices((X_val_pad, y_val_le)).batch(64).cache().prefetch(tf.data.AUTOTUNE)
 
 #LSTM-GRU Model architecture
-model = Sequential([
-    Embedding(input_dim=vocab_size, output_dim=embedding_dim, weights= [embedding_matrix], input_length=max_length, trainable=False),
-    #LSTM layer 1
-    Bidirectional(LSTM(250, return_sequences=True)),
-    #GRU layer
-    Bidirectional(GRU(250, return_sequences=False)),
-])
-#Internal Dense Layers with Dropout
-for _ in range(1):
-    model.add(Dense(64, activation='relu'))
-    model.add(Dropout(0.5))
-
-#Output Layer
-model.add(Dense(4, activation='softmax'))
-
-#Compile the model
-model.compile(optimizer='adam', loss='categorical_crossentropy', metrics=['accuracy'])
-model.build(input_shape=(None, max_length))
+#The RNN kwargs below are the CuDNN requirements (tanh/sigmoid, no recurrent dropout,
+#no unroll, bias, reset_after for GRU, masks strictly right-padded). Changing any of
+#them silently falls back to the much slower generic RNN kernel on GPU. Meeting them only
+#makes the layers eligible: Keras still picks the generic kernel on CPU or under XLA
+#(jit_compile=True), so keep the training step un-jitted.
+def build_model(matrix=None, embeddings_dtype='float16', batch_size=None, input_length=None):
+    model = Sequential([
+        Input(shape=(input_length,), batch_size=batch_size, dtype='int32'),
+        FrozenEmbedding(input_dim=vocab_size, output_dim=embedding_dim, matrix=matrix, mask_zero=True,
+                        embeddings_dtype=embeddings_dtype),
+        #LSTM layer 1
+        Bidirectional(LSTM(250, return_sequences=True, activation='tanh', recurrent_activation='sigmoid',
+                           recurrent_dropout=0, unroll=False, use_bias=True)),
+        #GRU layer
+        Bidirectional(GRU(250, return_sequences=False, activation='tanh', recurrent_activation='sigmoid',
+                          recurrent_dropout=0, unroll=False, use_bias=True, reset_after=True)),
+    ])
+    #Internal Dense Layers with Dropout
+    for _ in range(1):
+        model.add(Dense(64, activation='relu'))
+        model.add(Dropout(0.5))
+
+    #Output Layer (float32 so the softmax and loss stay numerically stable)
+    model.add(Dense(4, activation='softmax', dtype='float32'))
+    return model
+
+model = build_model(embedding_matrix)
+
+#Compile the model (no XLA: the fused CuDNN RNN kernels are not XLA-compiled, so
+#jit_compile would push the LSTM/GRU onto the generic kernels)
+optimizer = tf.keras.mixed_precision.LossScaleOptimizer(tf.keras.optimizers.Adam())
+model.compile(optimizer=optimizer, loss='sparse_categorical_crossentropy', metrics=['accuracy'], jit_compile=False)
 model.summary()
 print("LSTM-GRU Model Compiled")
 #Train the model
 checkpoint = ModelCheckpoint('best_model.keras', monitor='val_accuracy', save_best_only=True, mode='max', verbose=1)
 earlystopping = EarlyStopping(monitor='val_accuracy', patience=3, restore_best_weights=True)
 history = model.fit(
-    X_train_pad, y_train_cat,
-    validation_data=(X_val_pad, y_val_cat),
+    ds_train,
+    validation_data=ds_val,
     epochs=20,
-    batch_size=64,
     callbacks=[earlystopping],
     # class_weight=class_weights,
     verbose=1
 )
 #Evaluate the model
-loss, accuracy = model.evaluate(X_test_pad, y_test_cat)
+loss, accuracy = model.evaluate(X_test_pad, y_test_le)
 print(f'Test Accuracy: {accuracy:.2f}')
 
 
@@ -264,14 +302,33 @@ import pickle
 with open('tokenizer.pickle', 'wb') as handle:
     pickle.dump(tokenizer, handle)
 meta = {
-    'label_classes': list(label_encoder.classes_),
+    'label_classes': class_names,
     'maxlen': max_length,
     'vocab_size': vocab_size,
     'embedding_dim': embedding_dim
 }
 with open('meta.json', 'w') as handle:
     json.dump(meta, handle)
-model.save('sefaced_email_model.keras')
+
+#Rebuild a float32 copy for saving and export. mixed_float16 is only for GPU training;
+#saving the trained model would store the float16 policy in every layer and the CPU
+#inference server would run the RNNs in float16.
+tf.keras.mixed_precision.set_global_policy('float32')
+serving_model = build_model()
+serving_model.set_weights(model.get_weights())
+serving_model.save('sefaced_email_model.keras')
+
+#Export a dynamic-range quantized TFLite model for the inference server. A fixed
+#(1, max_length) input lets the RNN loops lower to builtin TFLite ops (a dynamic batch
+#leaves Flex TensorList ops the stock interpreter can't run), and float32 embeddings let
+#the quantizer cover the embedding table along with the LSTM/GRU and Dense kernels.
+export_model = build_model(embeddings_dtype='float32', batch_size=1, input_length=max_length)
+export_model.set_weights([w.astype(np.float32) for w in serving_model.get_weights()])
+converter = tf.lite.TFLiteConverter.from_keras_model(export_model)
+converter.optimizations = [tf.lite.Optimize.DEFAULT]
+tflite_model = converter.convert()
+with open('sefaced_email_model.tflite', 'wb') as handle:
+    handle.write(tflite_model)
 
 
 
@@ -0,0 +1,58 @@
+import tensorflow as tf
+
+try:  # Keras 3 masks are computed on symbolic KerasTensors, which need keras.ops
+    from keras.ops import not_equal
+except ImportError:  # Keras 2
+    not_equal = tf.not_equal
+
+
+@tf.keras.utils.register_keras_serializable(package="spoofguard")
+class FrozenEmbedding(tf.keras.layers.Layer):
+    """Non-trainable embedding lookup over a float16 copy of a pretrained matrix.
+
+    Stored in half precision, so it halves the gather bandwidth and the saved size
+    of the GloVe vectors compared to a frozen Embedding layer (``embeddings_dtype``
+    can be set to float32 for exports that quantize it instead). With ``mask_zero``
+    id 0 is treated as padding, like ``Embedding(mask_zero=True)``.
+    """
+
+    def __init__(self, input_dim, output_dim, matrix=None, mask_zero=False, embeddings_dtype="float16", **kwargs):
+        kwargs.pop("trainable", None)
+        super().__init__(trainable=False, **kwargs)
+        self.input_dim = input_dim
+        self.output_dim = output_dim
+        self.mask_zero = mask_zero
+        self.embeddings_dtype = embeddings_dtype
+        self._matrix = matrix
+
+    def build(self, input_shape):
+        self.embeddings = self.add_weight(
+            name="embeddings",
+            shape=(self.input_dim, self.output_dim),
+            dtype=self.embeddings_dtype,
+            initializer="zeros",
+            trainable=False,
+        )
+        if self._matrix is not None:
+            self.embeddings.assign(tf.cast(self._matrix, self.embeddings_dtype))
+            self._matrix = None
+        super().build(input_shape)
+
+    def call(self, inputs):
+        vectors = tf.nn.embedding_lookup(self.embeddings, tf.cast(inputs, tf.int32))
+        return tf.cast(vectors, self.compute_dtype)
+
+    def compute_mask(self, inputs, mask=None):
+        if not self.mask_zero:
+            return None
+        return not_equal(inputs, 0)
+
+    def get_config(self):
+        config = super().get_config()
+        config.update({
+            "input_dim": self.input_dim,
+            "output_dim": self.output_dim,
+            "mask_zero": self.mask_zero,
+            "embeddings_dtype": self.embeddings_dtype,
+        })
+        return config